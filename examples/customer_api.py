@@ -4,6 +4,7 @@ import sqlalchemy.orm
 import uvicorn
 from fastapi import FastAPI, Query
 from pydantic import BaseModel
+from sqlalchemy import event
 from sqlalchemy.pool import StaticPool
 from starlette.exceptions import HTTPException
 
@@ -13,9 +14,29 @@ from supine.filter import DataclassFilterMixin, Filter
 from supine.resource import Resource
 from supine.router import SupineRouter
 
+# an in-memory SQLite database only exists on the connection that created it, so this
+# demo shares one connection via StaticPool. For a file-backed database, drop poolclass
+# and size the default QueuePool instead, e.g. pool_size=25, max_overflow=25
 engine = sqlalchemy.create_engine(
     "sqlite://?check_same_thread=False", poolclass=StaticPool, echo=True
 )
+
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a write is in progress, and synchronous=NORMAL
+    # is safe under WAL. journal_mode is ignored by in-memory databases.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+# create the engine and sessionmaker once and share them, so every request checks out
+# a connection from the same pool
 S = sqlalchemy.orm.sessionmaker(bind=engine)
 OrmBase = sqlalchemy.orm.declarative_base()
 
@@ -28,6 +49,8 @@ class TerritoryOrm(OrmBase):
     territory_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
     name = sqlalchemy.Column(sqlalchemy.String(256))
 
+    customers = sqlalchemy.orm.relationship("CustomerOrm", back_populates="territory")
+
 
 class CustomerOrm(OrmBase):
     __tablename__ = "customer"
@@ -37,9 +60,9 @@ class CustomerOrm(OrmBase):
     last_name = sqlalchemy.Column(sqlalchemy.String(256))
     territory_id = sqlalchemy.Column(sqlalchemy.ForeignKey("territory.territory_id"))
 
-    territory = sqlalchemy.orm.relationship(TerritoryOrm)
+    territory = sqlalchemy.orm.relationship(TerritoryOrm, back_populates="customers")
     territories = sqlalchemy.orm.relationship(
-        TerritoryOrm, uselist=True, overlaps="territory"
+        TerritoryOrm, uselist=True, overlaps="territory,customers"
     )
 
 
@@ -91,11 +114,22 @@ class CustomerFilter(DataclassFilterMixin, Filter):
 
 with S.begin() as session:
     OrmBase.metadata.create_all(bind=session.get_bind())
-    session.add(TerritoryOrm(territory_id=1, name="London"))
-    session.add(
-        CustomerOrm(
-            customer_id=1, first_name="Sherlock", last_name="Holmes", territory_id=1
-        )
+    # insert() with a list of dicts is an executemany, skipping the unit of work and
+    # attribute events an orm instance per row would go through. Use this when seeding
+    # many rows
+    session.execute(
+        sqlalchemy.insert(TerritoryOrm), [{"territory_id": 1, "name": "London"}]
+    )
+    session.execute(
+        sqlalchemy.insert(CustomerOrm),
+        [
+            {
+                "customer_id": 1,
+                "first_name": "Sherlock",
+                "last_name": "Holmes",
+                "territory_id": 1,
+            }
+        ],
     )
 
 # RESOURCES ###################################################################
@@ -142,4 +176,12 @@ get_territories = supine_router.include_get_resource_list(territory_resource)
 app.include_router(supine_router)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    # uvicorn only uses uvloop/httptools "if possible", so ask for them explicitly
+    uvicorn.run(
+        app,
+        host="127.0.0.1",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+    )
@@ -1,17 +1,47 @@
-from .api_response import ApiError, ApiResponse
-from .base_model import OrmModeBaseModel
-from .filter import DataclassFilterMixin, Filter
-from .pagination import Pagination
-from .resource import Resource
-from .router import SupineRouter
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .api_response import ApiError, ApiResponse
+    from .base_model import OrmModeBaseModel
+    from .filter import DataclassFilterMixin, Filter
+    from .pagination import Pagination
+    from .resource import Resource
+    from .router import SupineRouter
+
+# submodules are only imported on first access (PEP 562), so using e.g. Filter
+# doesn't pull in FastAPI through the router
+_lazy = {
+    "ApiError": "api_response",
+    "ApiResponse": "api_response",
+    "DataclassFilterMixin": "filter",
+    "Filter": "filter",
+    "OrmModeBaseModel": "base_model",
+    "Pagination": "pagination",
+    "Resource": "resource",
+    "SupineRouter": "router",
+}
 
 __all__ = [
-    ApiError,
-    ApiResponse,
-    DataclassFilterMixin,
-    Filter,
-    OrmModeBaseModel,
-    Pagination,
-    Resource,
-    SupineRouter,
+    "ApiError",
+    "ApiResponse",
+    "DataclassFilterMixin",
+    "Filter",
+    "OrmModeBaseModel",
+    "Pagination",
+    "Resource",
+    "SupineRouter",
 ]
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_lazy[name]}", __name__)
+    value = getattr(module, name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,8 +1,8 @@
 from enum import Enum
 from typing import Any, Generic, List, TypeVar, Union
 
-from pydantic import BaseModel, Field
-from pydantic.generics import GenericModel
+from pydantic import BaseModel, ConfigDict, Field
+from starlette.responses import JSONResponse
 
 
 Result = TypeVar("Result")
@@ -14,14 +14,29 @@ class ApiResponseStatus(str, Enum):
 
 
 class PaginationData(BaseModel):
-    start: int = Field(..., description="First record offset", example=0)
-    count: int = Field(..., description="Number of records returned", example=1)
+    model_config = ConfigDict(from_attributes=True)
+
+    start: int = Field(
+        ..., description="First record offset", json_schema_extra={"example": 0}
+    )
+    count: int = Field(
+        ..., description="Number of records returned", json_schema_extra={"example": 1}
+    )
     total: Union[int, None] = Field(
-        None, description="Total number of records available", example=1
+        None,
+        description="Total number of records available",
+        json_schema_extra={"example": 1},
     )
 
-    class Config:
-        orm_mode = True
+    @classmethod
+    def from_pagination(cls, pagination):
+        """
+        builds the pagination block from a Pagination filled in by the server.
+        validating three ints is cheaper in pydantic v2 than model_construct()
+        """
+        return cls(
+            start=pagination.start, count=pagination.count, total=pagination.total
+        )
 
 
 class ApiError(BaseModel):
@@ -33,10 +48,29 @@ class ApiError(BaseModel):
         return cls(detail=exc.detail)
 
 
-class ApiResponse(GenericModel, Generic[Result]):
+class ApiResponse(BaseModel, Generic[Result]):
     status: ApiResponseStatus = ApiResponseStatus.success
     result: Union[Result, None] = None
 
 
-class PaginatedResponse(ApiResponse, GenericModel, Generic[Result]):
+class PaginatedResponse(ApiResponse[Result], Generic[Result]):
     pagination: Union[PaginationData, None] = None
+
+
+class SupineJSONResponse(JSONResponse):
+    """
+    Renders an ApiResponse (or any pydantic model) straight to JSON. bytes are taken to be rendered JSON already.
+
+    Returning this from a route skips FastAPI's response_model re-validation and its
+    jsonable_encoder pass, which would otherwise walk the already-validated model again.
+    The response_model is still used for the OpenAPI schema.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content  # already rendered
+        if isinstance(content, BaseModel):
+            return content.model_dump_json(by_alias=True, exclude_unset=True).encode(
+                "utf-8"
+            )
+        return super().render(content)
@@ -1,23 +1,32 @@
-from fastapi.encoders import jsonable_encoder
+from functools import lru_cache
+
+from fastapi.responses import ORJSONResponse
 from fastapi.utils import is_body_allowed_for_status_code
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import Response
+
+from supine.api_response import ApiResponseStatus
 
-from supine.api_response import ApiError
+# status codes are a small, fixed set
+_body_allowed = lru_cache(maxsize=64)(is_body_allowed_for_status_code)
 
 
 async def supine_http_exception_handler(
     request: Request, exc: HTTPException
 ) -> Response:
     """
-    Primarily copied from FastAPI's base implementation, but uses ApiError so that
-    the response will include 'status': 'error' etc
+    Primarily copied from FastAPI's base implementation, but the body has the shape of ApiError
+    so that the response will include 'status': 'error' etc
+
+    The body is built as a plain dict and serialized once by orjson, skipping ApiError validation
+    and jsonable_encoder
     """
     headers = getattr(exc, "headers", None)
-    if not is_body_allowed_for_status_code(exc.status_code):
+    if not _body_allowed(exc.status_code):
         return Response(status_code=exc.status_code, headers=headers)
-    api_error = ApiError.from_exc(exc)
-    return JSONResponse(
-        jsonable_encoder(api_error), status_code=exc.status_code, headers=headers
+    return ORJSONResponse(
+        {"detail": exc.detail, "status": ApiResponseStatus.error},
+        status_code=exc.status_code,
+        headers=headers,
     )
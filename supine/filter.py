@@ -1,19 +1,10 @@
 import abc
 import dataclasses
-from typing import Any
+import operator
 
 import sqlalchemy.sql
 
 
-def exclude_none(d: list[tuple[str, Any]]) -> dict:
-    """
-    for use as dict_factory argument to dataclasses.asdict()
-    filters out "private" keys beginning with "_"
-    filters out values equal to None
-    """
-    return {k: v for (k, v) in d if v is not None and k[0] != "_"}
-
-
 class Filter(metaclass=abc.ABCMeta):
     def __init__(self, /, **kwargs):
         """
@@ -67,19 +58,36 @@ class DataclassFilterMixin:
 
         it is expected that most subclasses will need to override this method
         """
-        # noinspection PyDataclass
-        filter_by_args = dataclasses.asdict(self, dict_factory=exclude_none)
+        values = self._supine_field_getter(self)
+        if len(self._supine_field_names) == 1:
+            values = (values,)  # attrgetter with a single name returns a bare value
+        filter_by_args = {
+            name: value
+            for name, value in zip(self._supine_field_names, values)
+            if value is not None
+        }
         return query.filter_by(**filter_by_args)
 
-    def __init__(self):
-        if not getattr(self, "__fields__", None):
-            raise ValueError("you should define dataclass fields when using this mixin")
-
     def __new__(cls, *args, **kwargs):
         """require subclasses to be dataclasses"""
-        if not dataclasses.is_dataclass(cls):
-            raise ValueError(f"{cls!r} must be marked as a @dataclass")
-        # noinspection PyUnresolvedReferences,PyProtectedMember
-        if not getattr(cls, dataclasses._FIELDS):
-            raise ValueError(f"No dataclass fields defined on {cls!r}")
+        # checked once per class, the field names are cached for modify_query()
+        if "_supine_field_names" not in cls.__dict__:
+            field_names = _dataclass_field_names(cls)
+            cls._supine_field_names = field_names
+            cls._supine_field_getter = operator.attrgetter(*field_names)
         return super().__new__(cls, *args)
+
+
+def _dataclass_field_names(cls) -> tuple[str, ...]:
+    """
+    names of the dataclass fields on cls
+    filters out "private" fields beginning with "_"
+    """
+    if not dataclasses.is_dataclass(cls):
+        raise ValueError(f"{cls!r} must be marked as a @dataclass")
+    field_names = tuple(
+        field.name for field in dataclasses.fields(cls) if field.name[0] != "_"
+    )
+    if not field_names:
+        raise ValueError(f"No dataclass fields defined on {cls!r}")
+    return field_names
@@ -1,8 +1,20 @@
+import sqlalchemy
 from pydantic import conint
 from sqlalchemy.sql import func, Select
 
 
 class Pagination:
+    # dialects supporting count(*) OVER (), so the total can be fetched with the page,
+    # and the first server version that does
+    window_function_dialects = {
+        "postgresql": (8, 4),
+        "sqlite": (3, 25),
+        "mysql": (8, 0),
+        "mariadb": (10, 2),
+        "mssql": (9,),  # SQL Server 2005
+        "oracle": (8, 1),
+    }
+
     def __init__(self, start: conint(ge=0) = 0, count: conint(ge=1) = 200) -> None:
         self.start = start
         self.requested_count = count
@@ -10,11 +22,38 @@ class Pagination:
         self._total_count = None
 
     def fetch_paginated(self, session, query: Select):
-        self._total_count = self._query_count(query, session)
-        results = self._query_results(query, session)
+        page = _ordered(query).offset(self.start).limit(self.requested_count)
+        if self._supports_window_functions(session, query):
+            results = self._query_results_with_total(page, query, session)
+        else:
+            self._total_count = self._query_count(query, session)
+            results = self._query_results(page, session)
         self._count = len(results)
         return results
 
+    def _supports_window_functions(self, session, query):
+        # the bind for this query, sessions can have separate binds per mapper or table
+        dialect = session.get_bind(clause=query).dialect
+        name = "mariadb" if getattr(dialect, "is_mariadb", False) else dialect.name
+        min_version = self.window_function_dialects.get(name)
+        # the server version is only known once the engine has connected, until then the total is counted
+        version = dialect.server_version_info
+        return (
+            min_version is not None and version is not None and version >= min_version
+        )
+
+    def _query_results_with_total(self, page, query, session):
+        """single round trip: each row carries the total count of the unpaginated query"""
+        rows = session.execute(page.add_columns(func.count().over())).all()
+        if rows:
+            self._total_count = rows[0][-1]
+        elif self.start:
+            # paged past the end, there is no row to read the total from
+            self._total_count = self._query_count(query, session)
+        else:
+            self._total_count = 0
+        return [row[0] for row in rows]
+
     @staticmethod
     def _query_results(query, session):
         return session.scalars(query).fetchall()
@@ -32,3 +71,20 @@ class Pagination:
     @property
     def total(self):
         return self._total_count
+
+
+def _ordered(query: Select) -> Select:
+    """
+    query, ordered by the primary key of its first entity if it has no ORDER BY: pages of an unordered query
+    can overlap or skip rows, and SQL Server refuses OFFSET without ORDER BY
+    """
+    if query._order_by_clauses:
+        return query
+    entity = (
+        query.column_descriptions[0].get("entity")
+        if query.column_descriptions
+        else None
+    )
+    if entity is None:
+        return query
+    return query.order_by(*sqlalchemy.inspect(entity).primary_key)
@@ -1,17 +1,37 @@
+import logging
+import sys
 import warnings
 from datetime import datetime
-from functools import cached_property
-from itertools import chain
+from functools import cached_property, lru_cache
+from operator import attrgetter
 from typing import List, Type, Union
 
-from pydantic import BaseModel, create_model
-from sqlalchemy.orm import InstrumentedAttribute, joinedload
+import sqlalchemy
+from pydantic import BaseModel, ConfigDict, create_model, TypeAdapter
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import (
+    InstrumentedAttribute,
+    joinedload,
+    MANYTOONE,
+    raiseload,
+    selectinload,
+)
 
 from supine.api_response import ApiResponse, PaginatedResponse
 from supine.filter import Filter
 
+logger = logging.getLogger(__name__)
+
 _resource_registry = {}
 
+# loader options making any relationship that wasn't eagerly loaded raise instead of lazy loading,
+# so a response can't quietly issue one more query per relationship (or per row of a list)
+RAISE_ON_LAZY_LOAD = (raiseload("*"),)
+
+# generated result models are mostly used for serialization, so their validator is only
+# built if something actually validates one
+_deferred_build = ConfigDict(defer_build=True)
+
 
 class Resource:
     def __init__(
@@ -64,8 +84,9 @@ class Resource:
         :param max_age: number of seconds to indicate to client as the maximum amount of time to
             cache this resource. Only get-by-key routes allow caching.
         """
-        self.singular_name = singular_name
-        self.plural_name = plural_name
+        # interned, they are used as dict keys for every response
+        self.singular_name = sys.intern(singular_name)
+        self.plural_name = sys.intern(plural_name)
         self.orm_class = orm_class
         self.model = model
         self.create_params = create_params
@@ -95,16 +116,13 @@ class Resource:
             }
         }
         """
-        model = create_model(
-            self.model.__name__ + "Result",
-            __base__=BaseModel,
-            **{
-                self.singular_name: (self.model, ...),
-                **{exp.plural_name: (List[exp.model], None) for exp in self.expansions},
-            },
-        )
-        model.__doc__ = self.model.__doc__
-        return ApiResponse[model]
+        return ApiResponse[self.result_data_model]
+
+    @cached_property
+    def result_data_model(self):
+        """The model of the `result` member of `.result`"""
+        expansions_key = tuple((exp.plural_name, exp.model) for exp in self.expansions)
+        return _build_result_model(self.model, self.singular_name, expansions_key)
 
     @cached_property
     def list_result(self):
@@ -124,34 +142,94 @@ class Resource:
             }
         }
         """
-        model = create_model(
-            self.model.__name__ + "ListResult",
-            __base__=BaseModel,
-            **{self.plural_name: (List[self.model], [])},
-        )
-        return PaginatedResponse[model]
+        return PaginatedResponse[self.list_result_data_model]
+
+    @cached_property
+    def list_result_data_model(self):
+        """The model of the `result` member of `.list_result`"""
+        return _build_list_result_model(self.model, self.plural_name)
 
     @cached_property
-    def expansions(self):
+    def expansions(self) -> tuple:
         """
-        Returns the list of Resource objects that can be expanded on this Resource
+        Returns the tuple of Resource objects that can be expanded on this Resource
 
-        lazy-evaluates strings in the expansion list by looking them up in the resource registry
+        lazy-evaluates strings in the expansion list by looking them up in the resource registry.
+        Once resolved (at the latest by finalize()), this is a plain instance attribute.
         """
-        return [
+        return tuple(
             exp if isinstance(exp, Resource) else _resource_registry[exp]
             for exp in self._expansions
-        ]
+        )
+
+    def finalize(self):
+        """
+        Resolves `.expansions` and builds the `.result` and `.list_result` models, so that none of it happens
+        while serving a request. SupineRouter calls this when including a route for this Resource; any
+        Resource referenced by name in `expansions` must be declared by then.
+        """
+        for attr in (
+            "expansions",
+            "expansion_getters",
+            "result",
+            "list_result",
+            "result_builder",
+        ):
+            getattr(self, attr)
+        return self
+
+    def model_from_orm(self, orm_instance):
+        """
+        Converts an orm_class instance to a `.model` instance for use in a response.
+        Uses model_validate(), which in pydantic v2 is faster than model_construct() would be.
+        """
+        return self.model.model_validate(orm_instance, from_attributes=True)
+
+    def models_from_orm(self, orm_instances) -> list:
+        """
+        Converts a list of orm_class instances to `.model` instances in a single pydantic-core call,
+        which is considerably faster than converting them one by one.
+        """
+        return _list_adapter(self.model).validate_python(
+            orm_instances, from_attributes=True
+        )
+
+    @cached_property
+    def expansion_getters(self) -> tuple:
+        """(plural_name, operator.attrgetter(plural_name)) for each expansion, built once"""
+        return tuple(
+            (exp.plural_name, attrgetter(exp.plural_name)) for exp in self.expansions
+        )
+
+    @cached_property
+    def result_builder(self):
+        """
+        A function (orm_instance, expand=False) -> dict of the `.result_data_model` values for orm_instance,
+        with the expansions included if `expand` is set. The names and converters are bound once,
+        so building a response does no lookups on the Resource.
+        """
+        singular_name = self.singular_name
+        model_from_orm = self.model_from_orm
+        expansions = tuple(
+            (plural_name, get, exp.models_from_orm)
+            for (plural_name, get), exp in zip(self.expansion_getters, self.expansions)
+        )
+
+        def build_result(orm_instance, expand=False) -> dict:
+            results = {singular_name: model_from_orm(orm_instance)}
+            if expand:
+                for plural_name, get, models_from_orm in expansions:
+                    results[plural_name] = models_from_orm(get(orm_instance))
+            return results
+
+        return build_result
 
     def get_expansion_dict(self, orm_instance) -> dict[str, list]:
         """
         given an ORM instance, return a dict of
         expansion.plural_name to matching orm attribute
         """
-        return {
-            expansion.plural_name: getattr(orm_instance, expansion.plural_name)
-            for expansion in self.expansions
-        }
+        return {name: get(orm_instance) for name, get in self.expansion_getters}
 
     def etag(self, orm_instance) -> Union[str, None]:
         """return resource etag given an orm_class instance"""
@@ -159,23 +237,66 @@ class Resource:
             return None
         return getattr(orm_instance, self.etag_attr)
 
-    def last_modified(self, orm_instance) -> Union[datetime, None]:
-        """return resource last modified datetime given an orm_class instance"""
+    def current_etag(self, session, key) -> Union[str, None]:
+        """
+        return the stored etag of the orm_class instance with primary key `key`, selecting only the etag column
+        (no relationships, no other columns)
+        """
+        etag_column = getattr(self.orm_class, self.etag_attr)
+        return session.scalar(select(etag_column).where(self.primary_key == key))
+
+    def current_last_modified(self, session, key) -> Union[datetime, None]:
+        """like current_etag(), for the last modified datetime"""
+        last_modified_column = getattr(self.orm_class, self.last_modified_attr)
+        return session.scalar(
+            select(last_modified_column).where(self.primary_key == key)
+        )
+
+    @cached_property
+    def primary_key(self):
+        """the (single) primary key column of orm_class"""
+        return sqlalchemy.inspect(self.orm_class).primary_key[0]
+
+    def last_modified(self, orm_instance) -> Union[datetime, str, None]:
+        """
+        return resource last modified datetime given an orm_class instance
+        (or a str, if the attribute holds an already formatted http date)
+        """
         if self.last_modified_attr is None:
             return None
         return getattr(orm_instance, self.last_modified_attr)
 
     def expansion_joinedloads(self):
         """
-        Returns sqlalchemy joinedload() list for all possible expansions. Mostly meant for use in SupineRouter,
-        to enable a single query looking up all attributes when querying by key.
+        Returns sqlalchemy eager loading options for all possible expansions. Mostly meant for use in SupineRouter,
+        to avoid lazy loading each expansion separately when querying by key.
+        """
+        return list(self.expansion_joinedload_options)
+
+    @cached_property
+    def expansion_joinedload_options(self) -> tuple:
+        """
+        Same as expansion_joinedloads(), built once. The options only depend on orm_class and the expansions,
+        so requests with ?expand=1 can reuse them.
         """
         # generate a single query for each specified resource expansion attribute
         # getattr(orm_class, expansion.plural_name) should return a sqlalchemy relationship()
-        joined_loads = (
-            joinedloads(self.orm_class, exp.plural_name) for exp in self.expansions
+        options = []
+        for exp in self.expansions:
+            joinedloads(self.orm_class, exp.plural_name, options)
+        return tuple(options)
+
+    @cached_property
+    def expanded_by_key_query(self):
+        """
+        select() of a single orm_class instance and all of its expansions, with the primary key as the bound
+        parameter `key`. Built once, so SQLAlchemy's compiled cache can reuse the statement across requests.
+        """
+        return (
+            select(self.orm_class)
+            .where(self.primary_key == bindparam("key"))
+            .options(*RAISE_ON_LAZY_LOAD, *self.expansion_joinedload_options)
         )
-        return list(chain.from_iterable(joined_loads))
 
     def _register(self):
         """
@@ -183,29 +304,85 @@ class Resource:
         circular reference issues
         """
         resource_key = self.plural_name
-        if resource_key in _resource_registry:
-            warnings.warn(f"Resource {resource_key} already registered -- overwriting")
+        previous = _resource_registry.get(resource_key)
         _resource_registry[resource_key] = self
+        if previous is not None and previous is not self:
+            logger.warning(
+                "Resource %s already registered -- overwriting", resource_key
+            )
+
+
+@lru_cache(maxsize=None)
+def _build_result_model(model, singular_name, expansions_key):
+    """
+    cached so that Resources of the same shape share one generated model, and its pydantic-core schema
+
+    expansions_key is a tuple of (plural_name, model) pairs
+    """
+    result_model = create_model(
+        model.__name__ + "Result",
+        __config__=_deferred_build,
+        **{
+            singular_name: (model, ...),
+            **{
+                plural_name: (List[exp_model], None)
+                for plural_name, exp_model in expansions_key
+            },
+        },
+    )
+    result_model.__doc__ = model.__doc__
+    return result_model
+
+
+@lru_cache(maxsize=None)
+def _build_list_result_model(model, plural_name):
+    """cached like _build_result_model()"""
+    return create_model(
+        model.__name__ + "ListResult",
+        __config__=_deferred_build,
+        **{plural_name: (List[model], [])},
+    )
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model):
+    return TypeAdapter(List[model])
 
 
-def joinedloads(orm_class, attr_or_name):
+def joinedloads(orm_class, attr_or_name, out: list = None) -> list:
     """
-    if attr_or_name represents at least one relationship, generates joinedload() query options to load
-    the relationship(s)
+    if attr_or_name represents at least one relationship, returns query options to eagerly load
+    the relationship(s): selectinload() for one-to-many and many-to-many, which would multiply the rows
+    of a join, and joinedload() for many-to-one and one-to-one
 
-    calls itself recursively if the attr_or_name represents a list
+    a hybrid_property representing a list of relationships is expanded in place
+    options are appended to `out` if given, so several calls can share one list
     """
-    attr = attr_or_name
-    if isinstance(attr_or_name, str):
-        attr = getattr(orm_class, attr_or_name, None)
-    if isinstance(attr, InstrumentedAttribute):
-        # single relationship()
-        yield joinedload(attr)
-    elif getattr(attr, "is_attribute", False):
-        # hybrid_property with one or more relationship()s
-        yield from chain.from_iterable(joinedloads(orm_class, a) for a in attr)
-    else:
-        warnings.warn(f"could not emit joinedload() for {orm_class}.{attr_or_name}")
+    if out is None:
+        out = []
+    pending = [attr_or_name]
+    while pending:
+        attr_or_name = pending.pop()
+        attr = attr_or_name
+        if isinstance(attr_or_name, str):
+            attr = getattr(orm_class, attr_or_name, None)
+        if isinstance(attr, InstrumentedAttribute):
+            # single relationship()
+            if _is_to_one(attr.property):
+                out.append(joinedload(attr))
+            else:
+                out.append(selectinload(attr))
+        elif getattr(attr, "is_attribute", False):
+            # hybrid_property with one or more relationship()s, kept in their declared order
+            pending.extend(reversed(list(attr)))
+        else:
+            warnings.warn(f"could not emit joinedload() for {orm_class}.{attr_or_name}")
+    return out
+
+
+def _is_to_one(relationship) -> bool:
+    """many-to-one, or one-to-one (a one-to-many with uselist=False)"""
+    return relationship.direction is MANYTOONE or not relationship.uselist
 
 
 def null_filter():
@@ -1,45 +1,166 @@
 import warnings
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from enum import Enum
 from functools import lru_cache
 from itertools import chain
+from operator import attrgetter
 from typing import Any, Callable, Dict, List, Optional, Sequence, Type, Union
 
+import sqlalchemy
 from fastapi import Body, Depends, HTTPException, params, Query
 from fastapi.datastructures import Default
+from fastapi.responses import ORJSONResponse
 from fastapi.routing import APIRoute, APIRouter
-from sqlalchemy import select
-from sqlalchemy.orm import InstrumentedAttribute, joinedload, Session
+from pydantic import BaseModel
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import InstrumentedAttribute, joinedload, MANYTOONE, Session
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import Response
 from starlette.routing import BaseRoute
 from starlette.status import HTTP_304_NOT_MODIFIED, HTTP_404_NOT_FOUND
 from starlette.types import ASGIApp
 
-from supine.api_response import ApiResponse, ApiResponseStatus
+from supine.api_response import (
+    ApiResponse,
+    ApiResponseStatus,
+    PaginationData,
+    SupineJSONResponse,
+)
 from supine.filter import DataclassFilterMixin
 from supine.pagination import Pagination
-from supine.resource import Resource
+from supine.resource import RAISE_ON_LAZY_LOAD, Resource
 
 RFC9110_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+# http dates are always in english, whatever the locale strftime() would use
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = (
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+)
+
+
+@lru_cache(maxsize=4096)
+def format_http_date(dt: datetime) -> str:
+    """
+    formats a datetime as an RFC 9110 http date (RFC9110_DATE_FORMAT). naive datetimes are taken to be UTC.
+    memoized, the same row is usually requested many times
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return (
+        f"{_WEEKDAYS[dt.weekday()]}, {dt.day:02d} {_MONTHS[dt.month - 1]} {dt.year:04d} "
+        f"{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d} GMT"
+    )
+
+
+@lru_cache(maxsize=64)
+def _cache_control(max_age) -> str:
+    return f"private, must-revalidate, max-age={max_age}"
 
 
-def supine_generate_unique_id(route: APIRoute):
+def is_not_modified_since(
+    last_modified: Union[datetime, str], if_modified_since: str
+) -> bool:
     """
-    Simplify operation IDs so that generated API clients have simpler function names.
-
-    If you are using a Resource your operation ids will be based on the singular name:
-      Example: singular_name='product'
-          get_product
-          get_products
-          create_product
-          update_product
-          delete_product
-
-    Note this function does no name scoping, and so is prone to collisions.
-    Be careful with your Resource naming.
+    True if last_modified is not newer than the If-Modified-Since header's date.
+    last_modified may be a datetime, naive ones are taken to be UTC, or an already formatted http date.
+    Invalid header dates are ignored, as RFC 9110 requires, and so is an invalid formatted last_modified.
     """
-    return f"{route.name}"
+    if isinstance(last_modified, str) and last_modified == if_modified_since:
+        return True  # clients usually echo the Last-Modified header back
+    try:
+        if isinstance(last_modified, str):
+            last_modified = parsedate_to_datetime(last_modified)
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # http dates only have one second resolution
+    return int(last_modified.timestamp()) <= int(since.timestamp())
+
+
+def writes_with_returning(
+    session, orm_class, params_model: Type[BaseModel], statement: str
+) -> bool:
+    """
+    True if a create (statement="insert") or update (statement="update") of orm_class from params_model can be
+    done with a single INSERT/UPDATE ... RETURNING.
+
+    That needs a database supporting it, and, since such statements skip the orm attribute layer, an orm_class
+    mapped to a single table (no joined-table inheritance), without a version_id_col, @validates validators or
+    mapper insert/update events, and params that are all mapped columns.
+    Otherwise the instance is created or loaded and its attributes set through the orm.
+    """
+    # the bind for orm_class, sessions can have separate binds per mapper or table
+    dialect = session.get_bind(orm_class).dialect
+    if not getattr(dialect, f"{statement}_returning"):
+        return False
+    mapper = sqlalchemy.inspect(orm_class)
+    if len(mapper.tables) > 1 or mapper.version_id_col is not None:
+        return False
+    if mapper.validators:
+        return False
+    events = mapper.dispatch
+    if getattr(events, f"before_{statement}") or getattr(events, f"after_{statement}"):
+        return False
+    return set(params_model.model_fields) <= set(mapper.column_attrs.keys())
+
+
+def deletes_directly(orm_class) -> bool:
+    """
+    True if an instance of orm_class can be deleted with a single DELETE, without loading it.
+
+    Such a statement skips the orm unit of work, so that needs an orm_class mapped to a single table, without a
+    version_id_col or mapper delete events, and whose relationship()s leave nothing for the orm to do on delete:
+    many-to-ones without a delete cascade, and other relationships with passive_deletes, which are handled by
+    the database (for example with ON DELETE CASCADE foreign keys).
+    Otherwise the instance is loaded and deleted through the orm.
+    """
+    mapper = sqlalchemy.inspect(orm_class)
+    if len(mapper.tables) > 1 or mapper.version_id_col is not None:
+        return False
+    events = mapper.dispatch
+    if events.before_delete or events.after_delete:
+        return False
+    return all(
+        not rel.cascade.delete if rel.direction is MANYTOONE else rel.passive_deletes
+        for rel in mapper.relationships
+    )
+
+
+def is_column(orm_class, attr: str) -> bool:
+    """True if attr is a mapped column of orm_class, so it can be selected without loading the instance"""
+    mapper = sqlalchemy.inspect(orm_class, raiseerr=False)
+    return mapper is not None and attr in mapper.column_attrs
+
+
+# Simplify operation IDs so that generated API clients have simpler function names.
+#
+# If you are using a Resource your operation ids will be based on the singular name:
+#   Example: singular_name='product'
+#       get_product
+#       get_products
+#       create_product
+#       update_product
+#       delete_product
+#
+# Note this function does no name scoping, and so is prone to collisions.
+# Be careful with your Resource naming.
+supine_generate_unique_id: Callable[[APIRoute], str] = attrgetter("name")
 
 
 # noinspection PyPep8Naming
@@ -59,7 +180,7 @@ class SupineRouter(APIRouter):
         prefix: str = "",
         tags: Optional[List[Union[str, Enum]]] = None,
         dependencies: Optional[Sequence[params.Depends]] = None,
-        default_response_class: Type[Response] = Default(JSONResponse),
+        default_response_class: Type[Response] = Default(ORJSONResponse),
         responses: Optional[Dict[Union[int, str], Dict[str, Any]]] = None,
         callbacks: Optional[List[BaseRoute]] = None,
         routes: Optional[List[BaseRoute]] = None,
@@ -75,8 +196,19 @@ class SupineRouter(APIRouter):
             [APIRoute], str
         ] = supine_generate_unique_id,
         sqlalchemy_sessionmaker=None,
+        validate_responses: bool = True,
     ) -> None:
+        """
+        Accepts the same arguments as FastAPI's APIRouter, plus:
+
+        :param sqlalchemy_sessionmaker: creates the SQLAlchemy session used by each request
+
+        :param validate_responses: if False, response models are built with model_construct() instead of being
+            validated. Only turn this off if your orm_class attributes always match your Resource models:
+            nothing checks the data before it is serialized.
+        """
         self.sqlalchemy_sessionmaker = sqlalchemy_sessionmaker
+        self.validate_responses = validate_responses
         super().__init__(
             prefix=prefix,
             tags=tags,
@@ -110,28 +242,45 @@ class SupineRouter(APIRouter):
         finally:
             session.close()
 
+    def build_response_model(self, model: Type[BaseModel], **values):
+        """instantiates a response model, validating it unless .validate_responses is off"""
+        if self.validate_responses:
+            return model(**values)
+        return model.model_construct(**values)
+
     @staticmethod
     def set_cache_headers(
         request: Request,
         response: Response,
         max_age=0,
         etag=None,
-        last_modified: datetime = None,
+        last_modified: Union[datetime, str] = None,
     ):
-        if last_modified:
-            last_modified = last_modified.strftime(RFC9110_DATE_FORMAT)
-
-        if etag and request.headers.get("if-none-match", None) == etag:
-            raise HTTPException(HTTP_304_NOT_MODIFIED)
-        if last_modified and request.headers.get("if-modified-since", None):
-            raise HTTPException(HTTP_304_NOT_MODIFIED)
-
-        response.headers[
-            "cache-control"
-        ] = f"private, must-revalidate, max-age={max_age}"
+        """
+        Raises FastAPI 304 exception if the client's cached copy is still fresh, otherwise sets the caching headers
+        on response. last_modified can be given already formatted as an http date (see format_http_date()).
+        """
+        # without either validator there is nothing to compare the request headers to
+        if etag or last_modified:
+            headers = request.headers
+            if_none_match = headers.get("if-none-match")
+            if if_none_match is not None:
+                if etag and if_none_match == etag:
+                    raise HTTPException(HTTP_304_NOT_MODIFIED)
+            # If-Modified-Since is ignored when If-None-Match is present (RFC 9110 13.1.3)
+            elif last_modified:
+                if_modified_since = headers.get("if-modified-since")
+                if if_modified_since and is_not_modified_since(
+                    last_modified, if_modified_since
+                ):
+                    raise HTTPException(HTTP_304_NOT_MODIFIED)
+
+        response.headers["cache-control"] = _cache_control(max_age)
         if etag:
             response.headers["etag"] = etag
         if last_modified:
+            if not isinstance(last_modified, str):
+                last_modified = format_http_date(last_modified)
             response.headers["last-modified"] = last_modified
 
     def include_get_resource_by_id(self, resource: Resource):
@@ -143,6 +292,12 @@ class SupineRouter(APIRouter):
         :param resource: Resource, specifying the .orm_class and response .model
         :return: the added route
         """
+        resource.finalize()
+        # bound once here so the handler doesn't look them up on `resource` per request
+        result_model = resource.result
+        result_data_model = resource.result_data_model
+        build_result = resource.result_builder
+        max_age = resource.max_age
 
         @self.get(
             f"/{resource.singular_name}/{{key}}",
@@ -150,6 +305,8 @@ class SupineRouter(APIRouter):
             response_model_exclude_unset=True,
             name=f"get_{resource.singular_name}",
             tags=[resource.plural_name],
+            # resolved before the orm_instance dependency, so a 304 skips loading it
+            dependencies=[Depends(self.precondition_check_factory(resource))],
         )
         def get_obj(
             request: Request,
@@ -159,23 +316,37 @@ class SupineRouter(APIRouter):
             ),
             expand: bool = QueryExpand(),
         ):
-            results = {resource.singular_name: orm_instance}
-            if expand:
-                results.update(resource.get_expansion_dict(orm_instance))
+            results = build_result(orm_instance, expand)
 
             self.set_cache_headers(
                 request,
                 response,
-                max_age=resource.max_age,
+                max_age=max_age,
                 etag=resource.etag(orm_instance),
                 last_modified=resource.last_modified(orm_instance),
             )
 
-            return resource.result(status=ApiResponseStatus.success, result=results)
+            # cache headers were set on the injected response, carry them over
+            return SupineJSONResponse(
+                self.build_response_model(
+                    result_model,
+                    status=ApiResponseStatus.success,
+                    result=self.build_response_model(result_data_model, **results),
+                ),
+                headers=response.headers,
+            )
 
         return get_obj
 
     def include_get_resource_list(self, resource: Resource):
+        resource.finalize()
+        # bound once here so the handler doesn't look them up on `resource` per request
+        plural_name = resource.plural_name
+        list_result_model = resource.list_result
+        list_result_data_model = resource.list_result_data_model
+        models_from_orm = resource.models_from_orm
+        orm_class = resource.orm_class
+
         @self.get(
             f"/{resource.singular_name}",
             response_model=resource.list_result,
@@ -184,28 +355,51 @@ class SupineRouter(APIRouter):
             tags=[resource.plural_name],
         )
         def get_objects(
+            response: Response,
             pagination: Pagination = Depends(),
             query_filter: DataclassFilterMixin = Depends(resource.query_filter),
             session: Session = Depends(self.session),
         ):
-            query = select(resource.orm_class)
+            query = select(orm_class).options(*RAISE_ON_LAZY_LOAD)
             if query_filter is not None:
                 query = query_filter.modify_query(query)
             orm_instances = pagination.fetch_paginated(session, query)
 
-            return resource.list_result(
-                status=ApiResponseStatus.success,
-                result={resource.plural_name: orm_instances},
-                pagination=pagination,
+            return SupineJSONResponse(
+                self.build_response_model(
+                    list_result_model,
+                    status=ApiResponseStatus.success,
+                    result=self.build_response_model(
+                        list_result_data_model,
+                        **{plural_name: models_from_orm(orm_instances)},
+                    ),
+                    pagination=PaginationData.from_pagination(pagination),
+                ),
+                # headers set by dependencies, see get_obj()
+                headers=response.headers,
             )
 
         return get_objects
 
     def include_create_resource(self, resource):
+        """
+        Adds a route at `/<singular_name>` which creates an instance of resource.orm_class from resource.create_params.
+
+        Uses a single INSERT ... RETURNING where the database and orm_class allow it, see writes_with_returning().
+        """
         if resource.create_params is None:
             raise ValueError(
                 f"must set {resource!r}.create_params to include this route"
             )
+        resource.finalize()
+        # bound once here so the handler doesn't look them up on `resource` per request
+        result_model = resource.result
+        result_data_model = resource.result_data_model
+        build_result = resource.result_builder
+        orm_class = resource.orm_class
+        # looked up on the first request, sessions from .sqlalchemy_sessionmaker are expected to
+        # always bind orm_class to the same kind of database
+        use_returning = None
 
         @self.post(
             f"/{resource.singular_name}",
@@ -215,24 +409,61 @@ class SupineRouter(APIRouter):
             tags=[resource.plural_name],
         )
         def create_object(
+            response: Response,
             create_params: resource.create_params = Body(),
             session: Session = Depends(self.session),
         ):
-            orm_instance = resource.orm_class(**create_params.dict())
-            session.add(orm_instance)
-            session.commit()
-            return resource.result(
-                status=ApiResponseStatus.success,
-                result={resource.singular_name: orm_instance},
+            nonlocal use_returning
+            if use_returning is None:
+                use_returning = writes_with_returning(
+                    session, orm_class, resource.create_params, "insert"
+                )
+            values = create_params.model_dump()
+            if use_returning:
+                # one round trip, the row comes back with its server-generated values
+                orm_instance = session.scalars(
+                    insert(orm_class).values(**values).returning(orm_class)
+                ).one()
+            else:
+                orm_instance = orm_class(**values)
+                session.add(orm_instance)
+                session.flush()
+            # serialized before the commit, which would expire orm_instance and select it again
+            json_response = SupineJSONResponse(
+                self.build_response_model(
+                    result_model,
+                    status=ApiResponseStatus.success,
+                    result=self.build_response_model(
+                        result_data_model, **build_result(orm_instance)
+                    ),
+                ),
+                # headers set by dependencies, see get_obj()
+                headers=response.headers,
             )
+            session.commit()
+            return json_response
 
         return create_object
 
     def include_update_resource(self, resource):
+        """
+        Adds a route at `/<singular_name>/{key}` which updates the instance of resource.orm_class specified by the
+        primary key with the resource.update_params that were sent.
+
+        Uses a single UPDATE ... RETURNING where the database and orm_class allow it, see writes_with_returning().
+        """
         if resource.update_params is None:
             raise ValueError(
                 f"must set {resource!r}.update_params to include this route"
             )
+        resource.finalize()
+        # bound once here so the handler doesn't look them up on `resource` per request
+        result_model = resource.result
+        result_data_model = resource.result_data_model
+        build_result = resource.result_builder
+        orm_class = resource.orm_class
+        # looked up on the first request, see include_create_resource()
+        use_returning = None
 
         @self.patch(
             f"/{resource.singular_name}/{{key}}",
@@ -242,21 +473,66 @@ class SupineRouter(APIRouter):
             tags=[resource.plural_name],
         )
         def update_object(
-            orm_instance: resource.orm_class = Depends(
-                self.orm_instance_getter_factory(resource)
-            ),
+            response: Response,
+            key: int,
             update_params: resource.update_params = Body(),
             session: Session = Depends(self.session),
         ):
-            for attr_name, val in update_params.dict(exclude_unset=True).items():
-                setattr(orm_instance, attr_name, val)
-            session.commit()
-            return resource.result(
-                status=ApiResponseStatus.success,
-                result={resource.singular_name: orm_instance},
+            nonlocal use_returning
+            if use_returning is None:
+                use_returning = writes_with_returning(
+                    session, orm_class, resource.update_params, "update"
+                )
+            values = update_params.model_dump(exclude_unset=True)
+            if values and use_returning:
+                # one round trip instead of a select followed by an update
+                orm_instance = session.scalars(
+                    update(orm_class)
+                    .where(resource.primary_key == key)
+                    .values(**values)
+                    .returning(orm_class)
+                    # nothing else is loaded in this request's session yet
+                    .execution_options(synchronize_session=False)
+                ).one_or_none()
+            else:
+                orm_instance = session.get(orm_class, key)
+                if orm_instance is not None:
+                    for attr_name, val in values.items():
+                        setattr(orm_instance, attr_name, val)
+                    session.flush()
+            if orm_instance is None:
+                raise HTTPException(
+                    HTTP_404_NOT_FOUND, f"specified {resource.singular_name} not found"
+                )
+            # serialized before the commit, see create_object()
+            json_response = SupineJSONResponse(
+                self.build_response_model(
+                    result_model,
+                    status=ApiResponseStatus.success,
+                    result=self.build_response_model(
+                        result_data_model, **build_result(orm_instance)
+                    ),
+                ),
+                headers=response.headers,
             )
+            session.commit()
+            return json_response
 
     def include_delete_resource(self, resource):
+        """
+        Adds a route at `/<singular_name>/{key}` which deletes the single object of type resource.orm_class
+        specified by the primary key.
+
+        Uses a single DELETE, without loading the instance, where orm_class allows it, see deletes_directly().
+        """
+        orm_class = resource.orm_class
+        # the response never changes, so it is only rendered once
+        deleted_body = SupineJSONResponse(
+            self.build_response_model(ApiResponse, status=ApiResponseStatus.success)
+        ).body
+        # looked up on the first request, once the orm mappers are configured
+        delete_directly = None
+
         @self.delete(
             f"/{resource.singular_name}/{{key}}",
             response_model=ApiResponse,
@@ -264,16 +540,29 @@ class SupineRouter(APIRouter):
             name=f"delete_{resource.singular_name}",
             tags=[resource.plural_name],
         )
-        def delete_object(key: int, session: Session = Depends(self.session)):
-            orm_instance = session.get(resource.orm_class, key)
-            if orm_instance is None:
+        def delete_object(
+            response: Response, key: int, session: Session = Depends(self.session)
+        ):
+            nonlocal delete_directly
+            if delete_directly is None:
+                delete_directly = deletes_directly(orm_class)
+            if delete_directly:
+                deleted = session.execute(
+                    delete(orm_class).where(resource.primary_key == key),
+                    execution_options={"synchronize_session": False},
+                ).rowcount
+            else:
+                # cascades and delete events run through the orm
+                orm_instance = session.get(orm_class, key)
+                deleted = orm_instance is not None
+                if deleted:
+                    session.delete(orm_instance)
+            if not deleted:
                 raise HTTPException(
                     HTTP_404_NOT_FOUND, f"specified {resource.singular_name} not found"
                 )
-
-            session.delete(orm_instance)
             session.commit()
-            return ApiResponse(status=ApiResponseStatus.success)
+            return SupineJSONResponse(deleted_body, headers=response.headers)
 
     def orm_instance_getter_factory(self, resource: Resource):
         """
@@ -281,8 +570,9 @@ class SupineRouter(APIRouter):
         its primary key. Uses the session created by .sqlalchemy_sessionmaker, fetches the instance
         by using SQLAlchemy's session.get().
 
-        First-level relationship()s on the SQLAlchemy classes will be loaded with a join automatically
-        if the expand parameter is set on the request.
+        First-level relationship()s on the SQLAlchemy classes will be loaded eagerly if the expand parameter
+        is set on the request, using the prebuilt Resource.expanded_by_key_query instead of session.get().
+        Any other relationship raises when accessed instead of being lazy loaded (see RAISE_ON_LAZY_LOAD).
 
         Raises FastAPI 404 exception if object does not exist in the database
         """
@@ -292,11 +582,15 @@ class SupineRouter(APIRouter):
             expand: bool = QueryExpand(),
             session: Session = Depends(self.session),
         ):
-            query_options = []
             if expand:
-                query_options = resource.expansion_joinedloads()
-
-            obj = session.get(resource.orm_class, key, options=query_options)
+                obj = (
+                    session.execute(resource.expanded_by_key_query, {"key": key})
+                    .scalars()
+                    .unique()
+                    .one_or_none()
+                )
+            else:
+                obj = session.get(resource.orm_class, key, options=RAISE_ON_LAZY_LOAD)
             if obj is None:
                 raise HTTPException(
                     HTTP_404_NOT_FOUND, f"specified {resource.singular_name} not found"
@@ -305,6 +599,60 @@ class SupineRouter(APIRouter):
 
         return inner
 
+    def precondition_check_factory(self, resource: Resource):
+        """
+        Returns a Depends()-compatible function which raises FastAPI 304 exception when the client's
+        If-None-Match header matches the stored etag of the requested instance, or when there is no If-None-Match
+        and the stored last modified time is not newer than the If-Modified-Since header.
+
+        Only the etag or last modified column is selected, so a client with a fresh cache never causes the full
+        instance, its expansions, and the response to be built. This only pays off when the expand parameter is
+        set, and resource has expansions: otherwise loading the instance is a single-row select anyway, and
+        set_cache_headers() handles it. Attributes which aren't mapped columns (e.g. a @property) can't be
+        selected on their own, they are left to set_cache_headers() as well.
+        """
+        # without expansions ?expand=1 loads nothing more, the extra select would only add a round trip
+        has_expansions = bool(resource.expansions)
+        # looked up on the first request, once the orm mappers are configured
+        etag_is_column = last_modified_is_column = None
+
+        def inner(
+            request: Request,
+            key: int,
+            expand: bool = QueryExpand(),
+            session: Session = Depends(self.session),
+        ):
+            nonlocal etag_is_column, last_modified_is_column
+            if not expand or not has_expansions:
+                return
+            if_none_match = request.headers.get("if-none-match")
+            if if_none_match is not None:
+                # If-Modified-Since is ignored when If-None-Match is present, as in set_cache_headers()
+                if resource.etag_attr is None:
+                    return
+                if etag_is_column is None:
+                    etag_is_column = is_column(resource.orm_class, resource.etag_attr)
+                if etag_is_column and if_none_match == resource.current_etag(
+                    session, key
+                ):
+                    raise HTTPException(HTTP_304_NOT_MODIFIED)
+                return
+            if_modified_since = request.headers.get("if-modified-since")
+            if not if_modified_since or resource.last_modified_attr is None:
+                return
+            if last_modified_is_column is None:
+                last_modified_is_column = is_column(
+                    resource.orm_class, resource.last_modified_attr
+                )
+            if last_modified_is_column:
+                last_modified = resource.current_last_modified(session, key)
+                if last_modified and is_not_modified_since(
+                    last_modified, if_modified_since
+                ):
+                    raise HTTPException(HTTP_304_NOT_MODIFIED)
+
+        return inner
+
     def include_crud(self, resource: Resource):
         return (
             self.include_get_resource_by_id(resource),
@@ -1,20 +1,24 @@
-from functools import lru_cache
 from typing import Callable
 
 import sqlalchemy
 from fastapi import Depends, params
 from sqlalchemy.orm import Session, sessionmaker
 
+# The engine owns the connection pool, so it is created once and shared.
+# Creating an engine per request would open a new pool (and new connections) each time.
+# create_engine() doesn't connect, so doing this at import is cheap.
+_engine = sqlalchemy.create_engine("sqlite://")
+_sessionmaker = sessionmaker(_engine)
+
 
-@lru_cache
 def get_engine():
-    return sqlalchemy.create_engine("sqlite://")
+    return _engine
 
 
-@lru_cache()
 def get_sessionmaker():
-    return sessionmaker(get_engine())
+    """shared sessionmaker bound to the shared engine, see get_engine()"""
+    return _sessionmaker
 
 
 def get_session():
-    return get_sessionmaker()()
+    return _sessionmaker()
@@ -0,0 +1,22 @@
+from unittest import mock
+
+import pytest
+from pydantic import BaseModel
+
+from supine import Resource
+
+
+@pytest.fixture(scope="session")
+def crud_resource():
+    """
+    a Resource with params for every route, built once per test session.
+    including routes for it doesn't change the Resource, so it can be shared between routers
+    """
+    return Resource(
+        singular_name="resource",
+        plural_name="resources",
+        orm_class=mock.Mock(),
+        model=BaseModel,
+        create_params=BaseModel,
+        update_params=BaseModel,
+    )
@@ -1,13 +1,16 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from unittest import mock
 
 import pytest
+import sqlalchemy
+import sqlalchemy.orm
 from fastapi import FastAPI
+from sqlalchemy.pool import StaticPool
 from starlette.testclient import TestClient
 
 from supine.base_model import OrmModeBaseModel
 from supine.resource import Resource
-from supine.router import SupineRouter
+from supine.router import format_http_date, SupineRouter
 
 MISSING = object()
 
@@ -16,6 +19,58 @@ class R(OrmModeBaseModel):
     data: str
 
 
+OrmBase = sqlalchemy.orm.declarative_base()
+
+
+class VersionNoteOrm(OrmBase):
+    __tablename__ = "version_note"
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    stored_id = sqlalchemy.Column(sqlalchemy.ForeignKey("stored_version.id"))
+    computed_id = sqlalchemy.Column(sqlalchemy.ForeignKey("computed_version.id"))
+    text = sqlalchemy.Column(sqlalchemy.String(256))
+
+
+class VersionNote(OrmModeBaseModel):
+    text: str
+
+
+version_notes = Resource(
+    singular_name="version_note",
+    plural_name="version_notes",
+    orm_class=VersionNoteOrm,
+    model=VersionNote,
+)
+
+
+class StoredVersionOrm(OrmBase):
+    """etag and last modified stored in columns"""
+
+    __tablename__ = "stored_version"
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    data = sqlalchemy.Column(sqlalchemy.String(256))
+    etag = sqlalchemy.Column(sqlalchemy.String(256))
+    last_modified = sqlalchemy.Column(sqlalchemy.DateTime)
+    version_notes = sqlalchemy.orm.relationship(VersionNoteOrm)
+
+
+class ComputedVersionOrm(OrmBase):
+    """etag and last modified computed from other columns"""
+
+    __tablename__ = "computed_version"
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    data = sqlalchemy.Column(sqlalchemy.String(256))
+    version = sqlalchemy.Column(sqlalchemy.Integer)
+    version_notes = sqlalchemy.orm.relationship(VersionNoteOrm)
+
+    @property
+    def etag(self):
+        return f"version{self.version}"
+
+    @property
+    def last_modified(self):
+        return datetime(2020, 1, self.version)
+
+
 @pytest.fixture()
 def app():
     return FastAPI()
@@ -50,9 +105,10 @@ def resource():
     "last_modified_date,expected",
     [
         (datetime(2020, 1, 1, 0, 0, 0), "Wed, 01 Jan 2020 00:00:00 GMT"),
+        ("Wed, 01 Jan 2020 00:00:00 GMT", "Wed, 01 Jan 2020 00:00:00 GMT"),
         (None, MISSING),
     ],
-    ids=["last_modified_available", "last_modified_missing"],
+    ids=["last_modified_available", "last_modified_formatted", "last_modified_missing"],
 )
 def test_last_modified(
     app, client, session, resource, supine_router, last_modified_date, expected
@@ -86,6 +142,56 @@ def test_if_modified_since(app, client, session, resource, supine_router):
     assert response.status_code == 304
 
 
+@pytest.mark.parametrize(
+    "if_modified_since",
+    ["Tue, 31 Dec 2019 23:59:59 GMT", "not a date"],
+    ids=["modified_since", "invalid_date"],
+)
+def test_if_modified_since_stale(
+    app, client, session, resource, supine_router, if_modified_since
+):
+    """Ensures the record is sent when it changed after the client's copy, or the header is invalid"""
+    resource.last_modified_attr = "last_modified"
+
+    supine_router.include_get_resource_by_id(resource)
+    app.include_router(supine_router)
+
+    mock_obj = mock.Mock(data="test data", last_modified=datetime(2020, 1, 1, 0, 0, 0))
+    session.get.return_value = mock_obj
+
+    response = client.get(
+        "/resource/1", headers={"if-modified-since": if_modified_since}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize(
+    "last_modified, status_code",
+    [
+        ("Wed, 01 Jan 2020 00:00:00 GMT", 304),
+        ("Thu, 02 Jan 2020 00:00:00 GMT", 200),
+        ("not a date", 200),
+    ],
+    ids=["echoed", "modified_since", "invalid_date"],
+)
+def test_if_modified_since_formatted(
+    app, client, session, resource, supine_router, last_modified, status_code
+):
+    """Ensures If-Modified-Since is compared to a last modified that is stored already formatted"""
+    resource.last_modified_attr = "last_modified"
+
+    supine_router.include_get_resource_by_id(resource)
+    app.include_router(supine_router)
+
+    mock_obj = mock.Mock(data="test data", last_modified=last_modified)
+    session.get.return_value = mock_obj
+
+    response = client.get(
+        "/resource/1", headers={"if-modified-since": "Wed, 01 Jan 2020 00:00:00 GMT"}
+    )
+    assert response.status_code == status_code
+
+
 @pytest.mark.parametrize(
     "etag,expected",
     [
@@ -124,6 +230,137 @@ def test_if_none_match(app, client, session, resource, supine_router):
     assert response.status_code == 304
 
 
+@pytest.fixture()
+def sqlite_engine():
+    engine = sqlalchemy.create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    OrmBase.metadata.create_all(engine)
+    with sqlalchemy.orm.Session(engine) as s:
+        s.add(
+            StoredVersionOrm(
+                id=1,
+                data="test data",
+                etag="version1",
+                last_modified=datetime(2020, 1, 1),
+            )
+        )
+        s.add(ComputedVersionOrm(id=1, data="test data", version=1))
+        s.commit()
+    return engine
+
+
+@pytest.fixture()
+def statements(sqlite_engine):
+    """the sql statements executed during the test"""
+    executed = []
+    sqlalchemy.event.listen(
+        sqlite_engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: executed.append(statement),
+    )
+    return executed
+
+
+@pytest.fixture()
+def sqlite_client(app, client, sqlite_engine):
+    """
+    get-by-id routes for StoredVersionOrm at /stored and ComputedVersionOrm at /computed, expanding their notes,
+    and for StoredVersionOrm without expansions at /unexpanded
+    """
+    supine_router = SupineRouter(
+        sqlalchemy_sessionmaker=sqlalchemy.orm.sessionmaker(sqlite_engine)
+    )
+    for name, orm_class, expansions in (
+        ("stored", StoredVersionOrm, [version_notes]),
+        ("computed", ComputedVersionOrm, [version_notes]),
+        ("unexpanded", StoredVersionOrm, []),
+    ):
+        supine_router.include_get_resource_by_id(
+            Resource(
+                singular_name=name,
+                plural_name=f"{name}s",
+                orm_class=orm_class,
+                model=R,
+                expansions=expansions,
+                etag_attr="etag",
+                last_modified_attr="last_modified",
+            )
+        )
+    app.include_router(supine_router)
+    return client
+
+
+@pytest.mark.parametrize(
+    "if_none_match, status_code",
+    [("version1", 304), ("version0", 200)],
+    ids=["not_modified", "modified"],
+)
+@pytest.mark.parametrize("name", ["stored", "computed"])
+def test_if_none_match_expanded(
+    sqlite_client, statements, name, if_none_match, status_code
+):
+    """Ensures expanded requests honour If-None-Match, whether or not the etag is a column"""
+    response = sqlite_client.get(
+        f"/{name}/1", params={"expand": 1}, headers={"if-none-match": if_none_match}
+    )
+    assert response.status_code == status_code
+    if status_code == 200:
+        assert response.json()["result"][name]["data"] == "test data"
+    elif name == "stored":
+        # only the etag column was selected, the instance was never loaded
+        assert len(statements) == 1
+        assert "data" not in statements[0]
+
+
+@pytest.mark.parametrize(
+    "headers, status_code",
+    [
+        ({"if-none-match": "version1"}, 304),
+        ({"if-none-match": "version0"}, 200),
+        ({"if-modified-since": "Wed, 01 Jan 2020 00:00:00 GMT"}, 304),
+        ({"if-modified-since": "Tue, 31 Dec 2019 00:00:00 GMT"}, 200),
+    ],
+    ids=[
+        "etag_not_modified",
+        "etag_modified",
+        "date_not_modified",
+        "date_modified",
+    ],
+)
+def test_precondition_unexpanded(sqlite_client, statements, headers, status_code):
+    """Ensures a resource without expansions is checked with the single select loading it"""
+    response = sqlite_client.get("/unexpanded/1", params={"expand": 1}, headers=headers)
+    assert response.status_code == status_code
+    assert len(statements) == 1
+
+
+@pytest.mark.parametrize(
+    "if_modified_since, status_code",
+    [("Wed, 01 Jan 2020 00:00:00 GMT", 304), ("Tue, 31 Dec 2019 00:00:00 GMT", 200)],
+    ids=["not_modified", "modified"],
+)
+@pytest.mark.parametrize("name", ["stored", "computed"])
+def test_if_modified_since_expanded(
+    sqlite_client, statements, name, if_modified_since, status_code
+):
+    """Ensures expanded requests honour If-Modified-Since, whether or not last modified is a column"""
+    response = sqlite_client.get(
+        f"/{name}/1",
+        params={"expand": 1},
+        headers={"if-modified-since": if_modified_since},
+    )
+    assert response.status_code == status_code
+    if status_code == 200:
+        assert response.json()["result"][name]["data"] == "test data"
+    elif name == "stored":
+        # only the last modified column was selected, the instance was never loaded
+        assert len(statements) == 1
+        assert "data" not in statements[0]
+
+
 def test_max_age(app, client, session, resource, supine_router):
     """Ensures cache-control header has max-age set as specified when requesting object by id"""
     resource.max_age = 120
@@ -136,3 +373,16 @@ def test_max_age(app, client, session, resource, supine_router):
 
     response = client.get("/resource/1")
     assert "max-age=120" in response.headers["cache-control"]
+
+
+@pytest.mark.parametrize(
+    "dt",
+    [
+        datetime(2020, 1, 1, 0, 0, 0),
+        datetime(2020, 1, 1, 0, 0, 0, tzinfo=timezone.utc),
+        datetime(2020, 1, 1, 2, 0, 0, tzinfo=timezone(timedelta(hours=2))),
+    ],
+    ids=["naive", "utc", "offset"],
+)
+def test_format_http_date(dt):
+    assert format_http_date(dt) == "Wed, 01 Jan 2020 00:00:00 GMT"
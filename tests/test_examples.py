@@ -101,6 +101,15 @@ def test_delete_customer(client):
     assert response.json() == {"status": "success"}
 
 
+def test_delete_customer_not_found(client):
+    response = client.delete("/customer/2")
+    assert response.status_code == 404
+    assert response.json() == {
+        "status": "error",
+        "detail": "specified customer not found",
+    }
+
+
 def test_update_customer(client):
     response = client.patch("/customer/1", json={"last_name": "Cumberbatch"})
     assert response.json() == {
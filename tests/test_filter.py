@@ -1,4 +1,5 @@
 import dataclasses
+from unittest import mock
 
 import pytest
 
@@ -26,3 +27,15 @@ def test_dataclass_mixin_requires_dataclass_subclass():
 def test_dataclass_mixin_requires_fields():
     with pytest.raises(ValueError):
         NoFieldsDefined()
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [("x", {"named_attr": "x"}), (None, {})],
+    ids=["value_set", "value_none"],
+)
+def test_dataclass_mixin_filters_by_set_fields(value, expected):
+    """fields left as None should not be used to filter the query"""
+    query = mock.Mock()
+    DataclassFilter(named_attr=value).modify_query(query)
+    query.filter_by.assert_called_once_with(**expected)
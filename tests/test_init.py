@@ -0,0 +1,14 @@
+import supine
+
+
+def test_all_lists_names():
+    """__all__ must contain names, or `from supine import *` breaks"""
+    assert all(isinstance(name, str) for name in supine.__all__)
+
+
+def test_star_import():
+    """every name in __all__ resolves, including the lazily imported ones"""
+    namespace = {}
+    exec("from supine import *", namespace)
+    assert set(supine.__all__) <= set(namespace)
+    assert set(supine.__all__) <= set(dir(supine))
@@ -1,26 +1,137 @@
 import random
 from unittest import mock
 
-from supine.pagination import Pagination
+import pytest
+import sqlalchemy
+import sqlalchemy.orm
+
+from supine.pagination import _ordered, Pagination
+
+OrmBase = sqlalchemy.orm.declarative_base()
+
+# opaque stand-ins for the session and query when the query methods are stubbed out, shared by the tests
+_SESSION = mock.Mock()
+_QUERY = mock.Mock()
+_MOCK_DATA = [random.randint(0, 10) for _ in range(200)]
+
+
+class _StubPagination(Pagination):
+    """Pagination with the queries replaced by the values set on the instance"""
+
+    stub_total = 0
+    stub_results = ()
+
+    def _supports_window_functions(self, *args):
+        return False  # the mock session has no real bind to look up
+
+    def _query_count(self, *args):
+        return self.stub_total
+
+    def _query_results(self, *args):
+        return self.stub_results
+
+
+class RowOrm(OrmBase):
+    __tablename__ = "row"
+    row_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+
+
+@pytest.fixture(scope="module")
+def sqlite_engine():
+    engine = sqlalchemy.create_engine("sqlite://")
+    OrmBase.metadata.create_all(engine)
+    with sqlalchemy.orm.Session(engine) as session:
+        session.add_all(RowOrm(row_id=i) for i in range(1, 11))
+        session.commit()
+    return engine
+
+
+@pytest.fixture(scope="module")
+def sqlite_session(sqlite_engine):
+    with sqlalchemy.orm.Session(sqlite_engine) as session:
+        yield session
 
 
 def test_fetch_paginated_updates_total():
     """Given a pagination object, when .fetch_paginated is called, ensure .total is updated accordingly"""
-    p = Pagination(start=0, count=5)
-    with mock.patch.object(p, "_query_count", return_value=500):
-        with mock.patch.object(p, "_query_results"):
-            p.fetch_paginated(mock.Mock(), mock.Mock())
+    p = _StubPagination(start=0, count=5)
+    p.stub_total = 500
+    p.fetch_paginated(_SESSION, _QUERY)
 
     assert p.total == 500
 
 
 def test_fetch_paginated_updates_count():
     """Given a pagination object, when .fetch_paginated is called, ensure .count is updated accordingly"""
-    mock_data = [random.randint(0, 10) for _ in range(200)]
+    p = _StubPagination(start=0, count=5)
+    p.stub_total = 500
+    p.stub_results = _MOCK_DATA
+    p.fetch_paginated(_SESSION, _QUERY)
 
-    p = Pagination(start=0, count=5)
-    with mock.patch.object(p, "_query_count", return_value=500):
-        with mock.patch.object(p, "_query_results", return_value=mock_data):
-            p.fetch_paginated(mock.Mock(), mock.Mock())
+    assert p.count == len(_MOCK_DATA)
 
-    assert p.total == 500
+
+@pytest.mark.parametrize(
+    "start,expected_ids",
+    [(0, [1, 2, 3]), (8, [9, 10]), (20, [])],
+    ids=["first_page", "last_page", "past_the_end"],
+)
+def test_fetch_paginated_window_count(sqlite_session, start, expected_ids):
+    """Given a dialect with window functions, ensure the page and total come back together"""
+    p = Pagination(start=start, count=3)
+    query = sqlalchemy.select(RowOrm).order_by(RowOrm.row_id)
+    results = p.fetch_paginated(sqlite_session, query)
+
+    assert [r.row_id for r in results] == expected_ids
+    assert p.count == len(expected_ids)
+    assert p.total == 10
+
+
+def test_fetch_paginated_multiple_binds(sqlite_engine):
+    """Sessions binding engines per mapper have no default bind, the query's bind is used"""
+    sessionmaker = sqlalchemy.orm.sessionmaker(binds={RowOrm: sqlite_engine})
+    p = Pagination(start=0, count=3)
+    query = sqlalchemy.select(RowOrm).order_by(RowOrm.row_id)
+    with sessionmaker() as session:
+        results = p.fetch_paginated(session, query)
+
+    assert [r.row_id for r in results] == [1, 2, 3]
+    assert p.total == 10
+
+
+@pytest.mark.parametrize(
+    "query, expected_order_by",
+    [
+        (sqlalchemy.select(RowOrm), "ORDER BY row.row_id"),
+        (
+            sqlalchemy.select(RowOrm).order_by(RowOrm.row_id.desc()),
+            "ORDER BY row.row_id DESC",
+        ),
+    ],
+    ids=["unordered", "ordered"],
+)
+def test_pages_are_ordered(query, expected_order_by):
+    """Pages of an unordered query are ordered by the primary key, an existing ORDER BY is kept"""
+    assert str(_ordered(query)).endswith(expected_order_by)
+
+
+@pytest.mark.parametrize(
+    "server_version_info, expected",
+    [((3, 24, 0), False), ((3, 25, 0), True), (None, False)],
+    ids=["too_old", "supported", "not_connected"],
+)
+def test_window_functions_server_version(
+    sqlite_engine, monkeypatch, server_version_info, expected
+):
+    """Window functions are only used on server versions supporting them"""
+    monkeypatch.setattr(
+        sqlite_engine.dialect, "server_version_info", server_version_info
+    )
+    query = sqlalchemy.select(RowOrm)
+    with sqlalchemy.orm.Session(sqlite_engine) as session:
+        assert Pagination()._supports_window_functions(session, query) is expected
+
+        p = Pagination(start=0, count=3)
+        results = p.fetch_paginated(session, query)
+    assert [r.row_id for r in results] == [1, 2, 3]
+    assert p.total == 10
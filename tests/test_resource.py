@@ -0,0 +1,124 @@
+import pytest
+import sqlalchemy
+import sqlalchemy.orm
+from pydantic import BaseModel
+
+from supine.resource import joinedloads, RAISE_ON_LAZY_LOAD, Resource
+
+OrmBase = sqlalchemy.orm.declarative_base()
+
+author_tag = sqlalchemy.Table(
+    "author_tag",
+    OrmBase.metadata,
+    sqlalchemy.Column("author_id", sqlalchemy.ForeignKey("author.author_id")),
+    sqlalchemy.Column("tag_id", sqlalchemy.ForeignKey("tag.tag_id")),
+)
+
+
+class PublisherOrm(OrmBase):
+    __tablename__ = "publisher"
+    publisher_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+
+
+class AuthorOrm(OrmBase):
+    __tablename__ = "author"
+    author_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    publisher_id = sqlalchemy.Column(sqlalchemy.ForeignKey("publisher.publisher_id"))
+    publisher = sqlalchemy.orm.relationship(PublisherOrm)
+    books = sqlalchemy.orm.relationship("BookOrm")
+    profile = sqlalchemy.orm.relationship("ProfileOrm", uselist=False)
+    tags = sqlalchemy.orm.relationship("TagOrm", secondary=author_tag)
+
+
+class BookOrm(OrmBase):
+    __tablename__ = "book"
+    book_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    author_id = sqlalchemy.Column(sqlalchemy.ForeignKey("author.author_id"))
+
+
+class ProfileOrm(OrmBase):
+    __tablename__ = "profile"
+    profile_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    author_id = sqlalchemy.Column(sqlalchemy.ForeignKey("author.author_id"))
+
+
+class TagOrm(OrmBase):
+    __tablename__ = "tag"
+    tag_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+
+
+def _strategies(options):
+    """(relationship name, loading strategy) of each loader option"""
+    return [(opt.path[1].key, dict(opt.context[0].strategy)["lazy"]) for opt in options]
+
+
+@pytest.mark.parametrize(
+    "name, strategy",
+    [
+        ("publisher", "joined"),
+        ("profile", "joined"),
+        ("books", "selectin"),
+        ("tags", "selectin"),
+    ],
+    ids=["many_to_one", "one_to_one", "one_to_many", "many_to_many"],
+)
+def test_joinedloads(name, strategy):
+    """to-one relationships are joined, to-many ones, which would multiply the rows of a join, are selectin loaded"""
+    assert _strategies(joinedloads(AuthorOrm, name)) == [(name, strategy)]
+
+
+def test_joinedloads_shared_list():
+    """options are appended to `out`, so that several relationships share one list"""
+    options = []
+    joinedloads(AuthorOrm, "books", options)
+    joinedloads(AuthorOrm, AuthorOrm.publisher, options)
+    assert _strategies(options) == [("books", "selectin"), ("publisher", "joined")]
+
+
+def test_joinedloads_not_a_relationship():
+    with pytest.warns(UserWarning):
+        assert joinedloads(AuthorOrm, "no_such_relationship") == []
+
+
+@pytest.fixture()
+def session():
+    engine = sqlalchemy.create_engine("sqlite://")
+    OrmBase.metadata.create_all(engine)
+    with sqlalchemy.orm.Session(engine) as session:
+        session.add(
+            AuthorOrm(
+                author_id=1, publisher=PublisherOrm(), books=[BookOrm(), BookOrm()]
+            )
+        )
+        session.commit()
+        session.expunge_all()
+        yield session
+
+
+def test_raise_on_lazy_load(session):
+    """relationships that weren't eagerly loaded raise instead of issuing a query when accessed"""
+    author = session.get(AuthorOrm, 1, options=RAISE_ON_LAZY_LOAD)
+    with pytest.raises(sqlalchemy.exc.InvalidRequestError):
+        author.books
+
+
+def test_expanded_by_key_query(session):
+    """the expansions are loaded, any other relationship raises"""
+    author_resource = Resource(
+        singular_name="author",
+        plural_name="authors",
+        orm_class=AuthorOrm,
+        model=BaseModel,
+        expansions=[
+            Resource(
+                singular_name="book",
+                plural_name="books",
+                orm_class=BookOrm,
+                model=BaseModel,
+            )
+        ],
+    )
+    author = session.scalars(author_resource.expanded_by_key_query, {"key": 1}).one()
+    assert len(author.books) == 2
+    with pytest.raises(sqlalchemy.exc.InvalidRequestError):
+        author.publisher
@@ -1,46 +1,390 @@
+from types import SimpleNamespace
 from unittest import mock
 
 import pytest
+import sqlalchemy
+import sqlalchemy.orm
+from fastapi import Depends, FastAPI, Response
 from pydantic import BaseModel
+from sqlalchemy.pool import StaticPool
+from starlette.testclient import TestClient
 
-from supine import Resource, SupineRouter
+from supine import OrmModeBaseModel, Resource, SupineRouter
+from supine.router import deletes_directly, writes_with_returning
 
-resource = Resource(
-    singular_name="resource",
-    plural_name="resources",
-    orm_class=mock.Mock(),
-    model=BaseModel,
-    create_params=BaseModel,
-    update_params=BaseModel,
+OrmBase = sqlalchemy.orm.declarative_base()
+
+
+class WidgetOrm(OrmBase):
+    __tablename__ = "widget"
+    widget_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String(256))
+
+
+class Widget(OrmModeBaseModel):
+    widget_id: int
+    name: str
+
+
+class WidgetParams(BaseModel):
+    name: str
+
+
+class ShoutingWidgetOrm(OrmBase):
+    __tablename__ = "shouting_widget"
+    widget_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String(256))
+
+    @sqlalchemy.orm.validates("name")
+    def shout(self, key, value):
+        return value.upper()
+
+
+class EventWidgetOrm(OrmBase):
+    __tablename__ = "event_widget"
+    widget_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String(256))
+
+
+@sqlalchemy.event.listens_for(EventWidgetOrm, "before_update")
+def _touch(mapper, connection, target):
+    pass
+
+
+class EmployeeOrm(OrmBase):
+    __tablename__ = "employee"
+    employee_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String(256))
+
+
+class ManagerOrm(EmployeeOrm):
+    """joined-table inheritance, name is in the employee table"""
+
+    __tablename__ = "manager"
+    employee_id = sqlalchemy.Column(
+        sqlalchemy.ForeignKey("employee.employee_id"), primary_key=True
+    )
+    level = sqlalchemy.Column(sqlalchemy.Integer, default=1)
+
+
+class Manager(OrmModeBaseModel):
+    employee_id: int
+    name: str
+    level: int
+
+
+class VersionedWidgetOrm(OrmBase):
+    __tablename__ = "versioned_widget"
+    widget_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String(256))
+    version = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    __mapper_args__ = {"version_id_col": version}
+
+
+class ParentOrm(OrmBase):
+    __tablename__ = "parent"
+    parent_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String(256))
+    children = sqlalchemy.orm.relationship(
+        "ChildOrm", back_populates="parent", cascade="all, delete-orphan"
+    )
+
+
+class ChildOrm(OrmBase):
+    __tablename__ = "child"
+    child_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    parent_id = sqlalchemy.Column(sqlalchemy.ForeignKey("parent.parent_id"))
+    parent = sqlalchemy.orm.relationship("ParentOrm", back_populates="children")
+
+
+class Parent(OrmModeBaseModel):
+    parent_id: int
+    name: str
+
+
+class NicknameParams(BaseModel):
+    nickname: str  # not a column of any widget
+
+
+widget_resource = Resource(
+    singular_name="widget",
+    plural_name="widgets",
+    orm_class=WidgetOrm,
+    model=Widget,
+    create_params=WidgetParams,
+    update_params=WidgetParams,
+)
+shouting_widget_resource = Resource(
+    singular_name="shouting_widget",
+    plural_name="shouting_widgets",
+    orm_class=ShoutingWidgetOrm,
+    model=Widget,
+    create_params=WidgetParams,
+    update_params=WidgetParams,
+)
+manager_resource = Resource(
+    singular_name="manager",
+    plural_name="managers",
+    orm_class=ManagerOrm,
+    model=Manager,
+    create_params=WidgetParams,
+    update_params=WidgetParams,
+)
+parent_resource = Resource(
+    singular_name="parent",
+    plural_name="parents",
+    orm_class=ParentOrm,
+    model=Parent,
+)
+
+EXPECTED_CRUD_ROUTES = (
+    "get_resource",
+    "get_resources",
+    "create_resource",
+    "update_resource",
+    "delete_resource",
 )
 
 
-def test_cannot_add_update_route_without_params():
-    """When adding an update-route, missing update params should raise an exception"""
+@pytest.mark.parametrize(
+    "method_name, missing_params",
+    [
+        ("include_update_resource", "update_params"),
+        ("include_create_resource", "create_params"),
+    ],
+    ids=["update", "create"],
+)
+def test_cannot_add_route_without_params(method_name, missing_params):
+    """When adding a create- or update-route, missing params should raise an exception"""
     router = SupineRouter()
-    resource = mock.Mock(update_params=None)
+    # the include_* methods only read the missing params before raising
+    resource = SimpleNamespace(**{missing_params: None})
     with pytest.raises(ValueError):
-        router.include_update_resource(resource)
+        getattr(router, method_name)(resource)
 
 
-def test_cannot_add_create_route_without_params():
-    """When adding a create-route, missing create params should raise an exception"""
+def test_include_crud(crud_resource):
     router = SupineRouter()
-    resource = mock.Mock(create_params=None)
-    with pytest.raises(ValueError):
+    returned_functions = router.include_crud(crud_resource)
+
+    assert len(returned_functions) == len(EXPECTED_CRUD_ROUTES)
+    assert tuple(r.name for r in router.routes) == EXPECTED_CRUD_ROUTES
+
+
+@pytest.mark.parametrize("validate_responses", [True, False])
+def test_validate_responses(validate_responses):
+    """Responses are the same whether or not the response models are validated"""
+
+    class R(OrmModeBaseModel):
+        data: str
+
+    session = mock.Mock()
+    session.get.return_value = mock.Mock(data="test data")
+    router = SupineRouter(
+        sqlalchemy_sessionmaker=lambda: session, validate_responses=validate_responses
+    )
+    router.include_get_resource_by_id(
+        Resource(
+            singular_name="r",
+            plural_name="rs",
+            orm_class=mock.Mock(),
+            model=R,
+        )
+    )
+    app = FastAPI()
+    app.include_router(router)
+
+    response = TestClient(app).get("/r/1")
+    assert response.json() == {
+        "status": "success",
+        "result": {"r": {"data": "test data"}},
+    }
+
+
+@pytest.fixture()
+def widget_engine():
+    engine = sqlalchemy.create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    OrmBase.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture()
+def widget_client(widget_engine):
+    """
+    create/update/delete routes for the widget resources, with a session that binds each orm class.
+    built per test, the routes remember whether the database supports RETURNING
+    """
+    router = SupineRouter(
+        sqlalchemy_sessionmaker=sqlalchemy.orm.sessionmaker(
+            binds={
+                WidgetOrm: widget_engine,
+                ShoutingWidgetOrm: widget_engine,
+                EmployeeOrm: widget_engine,
+                ParentOrm: widget_engine,
+                ChildOrm: widget_engine,
+            }
+        )
+    )
+    for resource in (widget_resource, shouting_widget_resource, manager_resource):
         router.include_create_resource(resource)
+        router.include_update_resource(resource)
+    for resource in (widget_resource, manager_resource, parent_resource):
+        router.include_delete_resource(resource)
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
 
 
-def test_include_crud():
-    router = SupineRouter()
-    returned_functions = router.include_crud(resource)
-    created_route_names = [r.name for r in router.routes]
-
-    assert len(returned_functions) == 5
-    assert created_route_names == [
-        "get_resource",
-        "get_resources",
-        "create_resource",
-        "update_resource",
-        "delete_resource",
-    ]
+@pytest.mark.parametrize("returning", [True, False], ids=["returning", "no_returning"])
+def test_create_and_update(widget_engine, widget_client, monkeypatch, returning):
+    """create and update work with a per-mapper bind, with or without RETURNING support"""
+    monkeypatch.setattr(widget_engine.dialect, "insert_returning", returning)
+    monkeypatch.setattr(widget_engine.dialect, "update_returning", returning)
+
+    response = widget_client.post("/widget", json={"name": "bob"})
+    assert response.json()["result"] == {"widget": {"widget_id": 1, "name": "bob"}}
+    response = widget_client.patch("/widget/1", json={"name": "amy"})
+    assert response.json()["result"] == {"widget": {"widget_id": 1, "name": "amy"}}
+    response = widget_client.patch("/widget/404", json={"name": "amy"})
+    assert response.status_code == 404
+
+
+def test_create_and_update_run_validators(widget_client):
+    """orm classes with @validates are written through the orm, so the validators run"""
+    response = widget_client.post("/shouting_widget", json={"name": "bob"})
+    assert response.json()["result"]["shouting_widget"] == {
+        "widget_id": 1,
+        "name": "BOB",
+    }
+    response = widget_client.patch("/shouting_widget/1", json={"name": "amy"})
+    assert response.json()["result"]["shouting_widget"] == {
+        "widget_id": 1,
+        "name": "AMY",
+    }
+
+
+def test_create_and_update_inherited(widget_client):
+    """joined-table inheritance mappers are written through the orm, which knows which table has which column"""
+    response = widget_client.post("/manager", json={"name": "bob"})
+    assert response.json()["result"]["manager"] == {
+        "employee_id": 1,
+        "name": "bob",
+        "level": 1,
+    }
+    response = widget_client.patch("/manager/1", json={"name": "amy"})
+    assert response.json()["result"]["manager"] == {
+        "employee_id": 1,
+        "name": "amy",
+        "level": 1,
+    }
+
+
+@pytest.mark.parametrize(
+    "orm_class, params_model, statement, expected",
+    [
+        (WidgetOrm, WidgetParams, "insert", True),
+        (WidgetOrm, WidgetParams, "update", True),
+        (ShoutingWidgetOrm, WidgetParams, "insert", False),
+        (EventWidgetOrm, WidgetParams, "insert", True),
+        (EventWidgetOrm, WidgetParams, "update", False),
+        (WidgetOrm, NicknameParams, "update", False),
+        (ManagerOrm, WidgetParams, "insert", False),
+        (VersionedWidgetOrm, WidgetParams, "update", False),
+    ],
+    ids=[
+        "columns",
+        "columns_update",
+        "validator",
+        "other_event",
+        "event",
+        "not_a_column",
+        "inherited",
+        "version_id_col",
+    ],
+)
+def test_writes_with_returning(
+    widget_engine, orm_class, params_model, statement, expected
+):
+    session = sqlalchemy.orm.Session(widget_engine)
+    assert (
+        writes_with_returning(session, orm_class, params_model, statement) is expected
+    )
+
+
+def test_delete(widget_client):
+    """orm classes without cascades or delete events are deleted with a single DELETE"""
+    widget_client.post("/widget", json={"name": "bob"})
+    assert widget_client.delete("/widget/1").status_code == 200
+    assert widget_client.delete("/widget/1").status_code == 404
+
+
+def test_delete_cascades(widget_engine, widget_client):
+    """relationship() delete cascades run, the instance is deleted through the orm"""
+    with sqlalchemy.orm.Session(widget_engine) as session:
+        session.add(
+            ParentOrm(parent_id=1, name="bob", children=[ChildOrm(), ChildOrm()])
+        )
+        session.commit()
+
+    assert widget_client.delete("/parent/1").status_code == 200
+    assert widget_client.delete("/parent/1").status_code == 404
+    with sqlalchemy.orm.Session(widget_engine) as session:
+        assert session.scalars(sqlalchemy.select(ChildOrm)).all() == []
+
+
+def test_delete_inherited(widget_engine, widget_client):
+    """joined-table inheritance instances are deleted from all of their tables"""
+    widget_client.post("/manager", json={"name": "bob"})
+
+    assert widget_client.delete("/manager/1").status_code == 200
+    assert widget_client.delete("/manager/1").status_code == 404
+    with widget_engine.connect() as connection:
+        for table in ("employee", "manager"):
+            assert (
+                connection.scalar(sqlalchemy.text(f"select count(*) from {table}")) == 0
+            )
+
+
+@pytest.mark.parametrize(
+    "orm_class, expected",
+    [
+        (WidgetOrm, True),
+        (ChildOrm, True),
+        (ParentOrm, False),
+        (ManagerOrm, False),
+        (VersionedWidgetOrm, False),
+    ],
+    ids=["columns", "many_to_one", "delete_cascade", "inherited", "version_id_col"],
+)
+def test_deletes_directly(orm_class, expected):
+    assert deletes_directly(orm_class) is expected
+
+
+def test_dependency_headers(widget_engine):
+    """headers set on the injected Response by dependencies are kept by every crud route"""
+
+    def add_header(response: Response):
+        response.headers["x-request-id"] = "request1"
+
+    router = SupineRouter(
+        sqlalchemy_sessionmaker=sqlalchemy.orm.sessionmaker(widget_engine),
+        dependencies=[Depends(add_header)],
+    )
+    router.include_crud(widget_resource)
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    for response in (
+        client.post("/widget", json={"name": "bob"}),
+        client.get("/widget/1"),
+        client.get("/widget"),
+        client.patch("/widget/1", json={"name": "amy"}),
+        client.delete("/widget/1"),
+    ):
+        assert response.status_code == 200
+        assert response.headers["x-request-id"] == "request1"